@@ -5,43 +5,18 @@
 #
 # By default, this will install a wheel for the latest version of PySVN.
 
-from __future__ import print_function, unicode_literals
-
+# Imports are kept to what the command line path needs. The heavier
+# modules (tarfile, shutil, subprocess, urllib and friends) are imported
+# inside the functions that use them, so 'install.py --help' and
+# argument errors don't pay for them.
 import argparse
 import atexit
-import getpass
-import glob
+import functools
 import os
-import platform
-import re
-import shutil
-import subprocess
 import sys
-import tarfile
-import tempfile
-from subprocess import CalledProcessError
-
-try:
-    # Python 3
-    from urllib.error import URLError
-    from urllib.request import urlopen, urlretrieve
-except ImportError:
-    # Python 2
-    from urllib import urlretrieve
-    from urllib2 import URLError, urlopen
-
-try:
-    import pip
-except ImportError:
-    sys.stderr.write('Install pip for Python %s.%s and try again.\n'
-                     % sys.version_info[:2])
-    sys.exit(1)
 
-try:
-    import wheel
-except ImportError:
-    sys.stderr.write('Install wheel for Python %s.%s and try again.\n'
-                     % sys.version_info[:2])
+if sys.version_info[:2] < (3, 7):
+    sys.stderr.write('Python 3.7 or newer is required to install PySVN.\n')
     sys.exit(1)
 
 
@@ -49,8 +24,9 @@ INDEX_URL = 'https://sourceforge.net/projects/pysvn/rss?path=/pysvn&limit=10'
 DOWNLOAD_URL_MASK = (
     'https://sourceforge.net/projects/pysvn/files/pysvn/V%(version)s/'
     'pysvn-%(version)s.tar.gz/download')
-VERSION_RE = \
-    re.compile(br'<link>.*/files/pysvn/V(?P<version>[0-9\.-]+)/.*</link>')
+VERSION_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'pysvn-installer', 'version')
+VERSION_CACHE_TTL = 3600
 
 
 cwd = None
@@ -58,7 +34,50 @@ temp_path = None
 _debug_mode = (os.environ.get('DEBUG_PYSVN_INSTALLER') == '1')
 
 
+def check_dependencies():
+    """Ensure pip and wheel are available for this Python.
+
+    The packages are located without being imported, which keeps the
+    check cheap. If either is missing, an error is printed and the
+    installer exits.
+    """
+    from importlib.util import find_spec
+
+    for package in ('pip', 'wheel'):
+        if find_spec(package) is None:
+            sys.stderr.write('Install %s for Python %s.%s and try again.\n'
+                             % ((package,) + tuple(sys.version_info[:2])))
+            sys.exit(1)
+
+
 def destroy_temp():
+    import shutil
+    import subprocess
+
+    # Deleting the extracted source tree means thousands of unlinks,
+    # which would otherwise keep the user waiting after the result has
+    # already been printed. Hand the cleanup to a detached process and
+    # return immediately.
+    #
+    # Windows can't detach this way (and won't let files be deleted out
+    # from under a process as freely), so it falls back to deleting
+    # synchronously.
+    if os.name == 'posix':
+        try:
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    '-c',
+                    'import shutil, sys;'
+                    'shutil.rmtree(sys.argv[1], ignore_errors=True)',
+                    temp_path,
+                ],
+                start_new_session=True)
+
+            return
+        except OSError:
+            pass
+
     shutil.rmtree(temp_path)
 
 
@@ -67,25 +86,234 @@ def debug(msg):
         sys.stderr.write(msg)
 
 
-def get_pysvn_version():
+def _tarfile_copyfileobj(src, dst, length=None, exception=OSError,
+                         *args, **kwargs):
+    """Copy data between file objects using a large buffer.
+
+    This replaces :py:func:`tarfile.copyfileobj`, which copies member
+    payloads in 16KB chunks. PySVN's tarball contains some sizable C++
+    sources, and a 2MB buffer cuts the number of read()/write() syscalls
+    per member by two orders of magnitude.
+
+    Args:
+        src (file):
+            The file object to read from.
+
+        dst (file):
+            The file object to write to.
+
+        length (int, optional):
+            The exact number of bytes to copy, or ``None`` to copy until
+            EOF.
+
+        exception (type, optional):
+            The exception class to raise if the source ends early.
+
+        *args (tuple, unused):
+            Additional positional arguments, for compatibility across
+            Python versions.
+
+        **kwargs (dict, unused):
+            Additional keyword arguments, for compatibility across
+            Python versions.
+    """
+    import shutil
+
+    bufsize = 2 * 1024 * 1024
+
+    if length is None:
+        shutil.copyfileobj(src, dst, bufsize)
+        return
+
+    blocks, remainder = divmod(length, bufsize)
+
+    for _ in range(blocks):
+        buf = src.read(bufsize)
+
+        if len(buf) < bufsize:
+            raise exception('unexpected end of data')
+
+        dst.write(buf)
+
+    if remainder:
+        buf = src.read(remainder)
+
+        if len(buf) < remainder:
+            raise exception('unexpected end of data')
+
+        dst.write(buf)
+
+
+def _read_version_cache():
+    """Return the cached PySVN version lookup, if one exists.
+
+    Returns:
+        dict:
+        The cached data, or ``None`` if there's no usable cache.
+    """
+    import json
+
     try:
-        data = urlopen(INDEX_URL).read()
+        with open(VERSION_CACHE_PATH, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_version_cache(cache):
+    """Persist the result of a PySVN version lookup.
+
+    The cache is best-effort. Failure to write it is not an error.
+
+    Args:
+        cache (dict):
+            The data to cache.
+    """
+    import json
+
+    cache_dir = os.path.dirname(VERSION_CACHE_PATH)
+
+    try:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        with open(VERSION_CACHE_PATH, 'w') as fp:
+            json.dump(cache, fp)
+    except OSError as e:
+        debug('Unable to write version cache: %s\n' % e)
+
+
+def _parse_pysvn_version(data):
+    """Extract the newest PySVN version from RSS feed data.
+
+    This scans for the first download link of the form
+    ``/files/pysvn/V<version>/`` using a plain substring search, which
+    is linear in the feed size.
+
+    Args:
+        data (bytes):
+            The feed data read so far.
+
+    Returns:
+        str:
+        The version, or ``None`` if no complete version link was found.
+    """
+    prefix = b'/files/pysvn/V'
+    i = data.find(prefix)
+
+    if i == -1:
+        return None
+
+    start = i + len(prefix)
+    end = data.find(b'/', start)
+
+    if end == -1:
+        # The link may be split across read chunks. Wait for more data.
+        return None
+
+    version = data[start:end].decode('utf-8')
+
+    if not version or not all(c in '0123456789.-' for c in version):
+        return None
+
+    return version
+
+
+def get_pysvn_version(refresh=False):
+    import time
+    from urllib.error import HTTPError, URLError
+    from urllib.request import Request, urlopen
+
+    cache = _read_version_cache()
+    have_cached_version = bool(cache and cache.get('version'))
+
+    if not refresh:
+        # The latest version changes rarely, so keep the result of a
+        # lookup around for a while. This lets repeated installer runs
+        # (common in CI matrices) skip the RSS fetch entirely.
+        if (have_cached_version and
+            time.time() - cache.get('fetched_at', 0) < VERSION_CACHE_TTL):
+            debug('Using cached PySVN version %s\n' % cache['version'])
+
+            return cache['version']
+
+    request = Request(INDEX_URL)
+
+    if not refresh and have_cached_version:
+        # Send the validators from the last successful fetch, so an
+        # unchanged feed comes back as a bodyless 304 Not Modified
+        # instead of the full document.
+        if cache.get('etag'):
+            request.add_header('If-None-Match', cache['etag'])
+
+        if cache.get('last_modified'):
+            request.add_header('If-Modified-Since', cache['last_modified'])
+
+    # The first <link> carrying a version appears within the first few
+    # KB of the feed, so read it incrementally and stop as soon as we
+    # have a match rather than downloading the whole feed.
+    data = b''
+    version = None
+    etag = None
+    last_modified = None
+
+    try:
+        resp = urlopen(request)
+
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+
+        while len(data) < 16384:
+            chunk = resp.read(4096)
+
+            if not chunk:
+                break
+
+            data += chunk
+            version = _parse_pysvn_version(data)
+
+            if version:
+                break
+
+        resp.close()
+    except HTTPError as e:
+        if e.code == 304:
+            debug('RSS feed unchanged. Using cached PySVN version %s\n'
+                  % cache['version'])
+
+            cache['fetched_at'] = time.time()
+            _write_version_cache(cache)
+
+            return cache['version']
+
+        sys.stderr.write('Unable to fetch PySVN downloads RSS feed: %s\n' % e)
+        sys.stderr.write('Tried to load feed from %s\n' % INDEX_URL)
+        sys.exit(1)
     except URLError as e:
         sys.stderr.write('Unable to fetch PySVN downloads RSS feed: %s\n' % e)
         sys.stderr.write('Tried to load feed from %s\n' % INDEX_URL)
         sys.exit(1)
 
-    m = VERSION_RE.search(data)
-
-    if not m:
+    if not version:
         sys.stderr.write('Unable to find latest PySVN version in RSS feed.\n')
         sys.stderr.write('Please report to support@beanbaginc.com.\n')
         sys.exit(1)
 
-    return m.groups('version')[0].decode('utf-8')
+    _write_version_cache({
+        'version': version,
+        'fetched_at': time.time(),
+        'etag': etag,
+        'last_modified': last_modified,
+    })
+
+    return version
 
 
 def fetch_pysvn(pysvn_version):
+    import shutil
+    from urllib.error import URLError
+    from urllib.request import Request, urlopen
+
     url = DOWNLOAD_URL_MASK % {
         'version': pysvn_version,
     }
@@ -94,35 +322,415 @@ def fetch_pysvn(pysvn_version):
 
     tarball_path = os.path.join(temp_path, 'pysvn.tar.gz')
 
+    if _fetch_parallel(url, tarball_path):
+        return tarball_path
+
+    error = None
+
+    for attempt in range(3):
+        if os.path.exists(tarball_path):
+            existing_size = os.path.getsize(tarball_path)
+        else:
+            existing_size = 0
+
+        request = Request(url)
+
+        if existing_size > 0:
+            # A previous attempt fetched part of the tarball. Ask the
+            # server for just the remaining bytes, so a retry only costs
+            # what's still missing.
+            debug('Resuming download at byte %d\n' % existing_size)
+            request.add_header('Range', 'bytes=%d-' % existing_size)
+
+        try:
+            resp = urlopen(request, timeout=30)
+        except URLError as e:
+            error = e
+            continue
+
+        if existing_size > 0 and resp.getcode() != 206:
+            # The server ignored the Range header and is sending the
+            # whole tarball again. Start over from byte 0.
+            debug('Server does not support resume. Restarting download.\n')
+            existing_size = 0
+
+        total_size = None
+        content_range = resp.headers.get('Content-Range')
+        content_length = resp.headers.get('Content-Length')
+
+        if content_range and content_range.split('/')[-1].isdigit():
+            # Note that a server may legally report an unknown complete
+            # length ('bytes N-M/*'), which we can't validate against.
+            total_size = int(content_range.split('/')[-1])
+        elif content_length:
+            total_size = existing_size + int(content_length)
+
+        try:
+            with open(tarball_path, 'ab' if existing_size > 0 else 'wb') as fp:
+                shutil.copyfileobj(resp, fp, length=1024 * 1024)
+        except (URLError, OSError) as e:
+            error = e
+            continue
+
+        if total_size is None or os.path.getsize(tarball_path) == total_size:
+            return tarball_path
+
+        # The connection dropped before the full tarball arrived. Loop
+        # around and resume from where we left off.
+        debug('Short read: got %d of %d bytes\n'
+              % (os.path.getsize(tarball_path), total_size))
+        error = 'the download kept ending early'
+
+    sys.stderr.write('Unable to fetch PySVN %s: %s\n' % (pysvn_version, error))
+    sys.stderr.write('Please report to support@beanbaginc.com.\n')
+    sys.exit(1)
+
+
+def _fetch_chunk(url, fd, start, end):
+    """Download one byte range of a file to its offset on disk.
+
+    Args:
+        url (str):
+            The URL to download from.
+
+        fd (int):
+            An open file descriptor to write to.
+
+        start (int):
+            The first byte offset of the range.
+
+        end (int):
+            The last byte offset of the range (inclusive).
+
+    Raises:
+        urllib.error.URLError:
+            The server didn't honor the Range request, or the chunk came
+            back short.
+    """
+    from urllib.error import URLError
+    from urllib.request import Request, urlopen
+
+    request = Request(url)
+    request.add_header('Range', 'bytes=%d-%d' % (start, end))
+
+    resp = urlopen(request, timeout=30)
+
+    if resp.getcode() != 206:
+        raise URLError('Server did not honor the Range request')
+
+    offset = start
+
+    while True:
+        buf = resp.read(1024 * 1024)
+
+        if not buf:
+            break
+
+        os.pwrite(fd, buf, offset)
+        offset += len(buf)
+
+    if offset != end + 1:
+        raise URLError('Chunk %d-%d ended early at byte %d'
+                       % (start, end, offset))
+
+
+def _fetch_parallel(url, tarball_path, num_workers=4):
+    """Download a tarball using multiple parallel connections.
+
+    This issues a HEAD request to learn the file size, pre-sizes the
+    destination file, and then fetches byte ranges on several connections
+    at once, writing each chunk directly to its offset. This can
+    significantly speed up downloads from mirrors that cap per-connection
+    bandwidth.
+
+    Args:
+        url (str):
+            The URL to download from.
+
+        tarball_path (str):
+            The path of the file to write to.
+
+        num_workers (int, optional):
+            The number of parallel connections to use.
+
+    Returns:
+        bool:
+        ``True`` if the download completed. ``False`` if this method
+        isn't available or the server doesn't support it, in which case
+        the caller should fall back to a single-stream download.
+    """
+    from concurrent import futures
+    from urllib.error import URLError
+    from urllib.request import Request, urlopen
+
+    if not hasattr(os, 'pwrite'):
+        return False
+
+    request = Request(url, method='HEAD')
+
     try:
-        urlretrieve(url, filename=tarball_path)
-    except URLError as e:
-        sys.stderr.write('Unable to fetch PySVN %s: %s\n' % (pysvn_version, e))
-        sys.stderr.write('Please report to support@beanbaginc.com.\n')
-        sys.exit(1)
+        resp = urlopen(request, timeout=30)
+    except URLError:
+        return False
+
+    content_length = resp.headers.get('Content-Length')
+
+    if resp.headers.get('Accept-Ranges') != 'bytes' or not content_length:
+        debug('Server does not support ranged downloads.\n')
+        return False
+
+    total_size = int(content_length)
+
+    if total_size < num_workers:
+        return False
+
+    chunk_size = (total_size + num_workers - 1) // num_workers
+    fd = os.open(tarball_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+
+    try:
+        try:
+            os.ftruncate(fd, total_size)
+
+            with futures.ThreadPoolExecutor(
+                    max_workers=num_workers) as executor:
+                chunks = [
+                    executor.submit(_fetch_chunk, url, fd, start,
+                                    min(start + chunk_size, total_size) - 1)
+                    for start in range(0, total_size, chunk_size)
+                ]
+
+                for chunk in chunks:
+                    chunk.result()
+        finally:
+            os.close(fd)
+    except (URLError, OSError) as e:
+        # Don't leave a partially-written, pre-sized file around, or the
+        # single-stream fallback would try to resume from it.
+        debug('Parallel download failed (%s). Falling back to a single '
+              'stream.\n' % e)
+
+        if os.path.exists(tarball_path):
+            os.remove(tarball_path)
+
+        return False
+
+    return True
+
+
+def is_within_directory(directory, target):
+    """Return whether a target path lives within a directory.
+
+    Args:
+        directory (str):
+            The directory that should contain the target.
+
+        target (str):
+            The path to check.
+
+    Returns:
+        bool:
+        ``True`` if the target is within the directory.
+    """
+    abs_directory = os.path.abspath(directory)
+    abs_target = os.path.abspath(target)
 
-    return tarball_path
+    return os.path.commonprefix([abs_target, abs_directory]) == abs_directory
 
 
 def extract_pysvn(tarball_path):
-    with tarfile.open(tarball_path) as tar:
-        tar.extractall(temp_path)
+    import tarfile
 
     try:
-        return glob.glob(os.path.join(temp_path, 'pysvn-*'))[0]
-    except IndexError:
+        # python-isal provides a SIMD-accelerated gzip that decompresses
+        # 2-3x faster than the stdlib's zlib. It's optional; we fall
+        # back to the stdlib if it's not installed.
+        from isal import igzip
+    except ImportError:
+        igzip = None
+
+    tarfile.copyfileobj = _tarfile_copyfileobj
+
+    # Python 3.12+ (and security releases of older versions) ship a
+    # built-in 'data' extraction filter, which rejects absolute paths,
+    # path traversal, and device nodes in C and is both faster and
+    # stricter than our commonprefix() check. Use it when available.
+    use_data_filter = hasattr(tarfile, 'data_filter')
+
+    fileobj = None
+
+    if igzip is not None and tarball_path.endswith('.gz'):
+        # Decompress through isal and hand tarfile the raw tar stream.
+        # Decompression dominates the CPU cost of this step, so this is
+        # a sizable win when isal is available.
+        debug('Decompressing the tarball with isal\n')
+        fileobj = igzip.IGzipFile(tarball_path)
+        tar = tarfile.open(fileobj=fileobj, mode='r|')
+    else:
+        tar = tarfile.open(tarball_path)
+
+    src_path = None
+
+    try:
+        for member in tar:
+            # The tarball's contents all live under a single top-level
+            # pysvn-X.Y.Z directory. Note it as we pass by, so we don't
+            # need to re-scan temp_path for it afterward.
+            if src_path is None:
+                top_level = member.name.split('/', 1)[0]
+
+                if top_level.startswith('pysvn-'):
+                    src_path = os.path.join(temp_path, top_level)
+
+            if use_data_filter:
+                try:
+                    tar.extract(member, temp_path, filter='data')
+                except tarfile.FilterError:
+                    sys.stderr.write('The PySVN tarball contains an unsafe '
+                                     'path: %s\n' % member.name)
+                    sys.stderr.write('Please report to '
+                                     'support@beanbaginc.com.\n')
+                    sys.exit(1)
+            else:
+                target = os.path.join(temp_path, member.name)
+
+                if not is_within_directory(temp_path, target):
+                    sys.stderr.write('The PySVN tarball contains an unsafe '
+                                     'path: %s\n' % member.name)
+                    sys.stderr.write('Please report to '
+                                     'support@beanbaginc.com.\n')
+                    sys.exit(1)
+
+                tar.extract(member, temp_path)
+
+            # Iterating a TarFile caches every TarInfo seen so far in
+            # tar.members. We never rewind, so clear the cache to keep
+            # memory flat no matter how many members the tarball has.
+            tar.members = []
+    finally:
+        tar.close()
+
+        if fileobj is not None:
+            fileobj.close()
+
+    if src_path is None:
         sys.stderr.write('Unable to find pysvn-* directory in tarball.\n')
         sys.stderr.write('Please report to support@beanbaginc.com.\n')
         sys.exit(1)
 
+    return src_path
+
+
+_dir_contents_cache = {}
+
+
+def _has_file(dirpath, name):
+    """Return whether a directory contains a file with the given name.
+
+    Each directory is listed once and the names are cached, so probing
+    several files in the same directory costs a single directory read
+    rather than a stat() per probe.
+
+    Args:
+        dirpath (str):
+            The directory to look in.
+
+        name (str):
+            The file name to look for.
+
+    Returns:
+        bool:
+        ``True`` if the directory contains the file.
+    """
+    try:
+        names = _dir_contents_cache[dirpath]
+    except KeyError:
+        try:
+            names = set(os.listdir(dirpath))
+        except OSError:
+            names = set()
+
+        _dir_contents_cache[dirpath] = names
+
+    return name in names
+
+
+@functools.lru_cache(maxsize=None)
+def _run_output(cmd):
+    """Return the output of a command, caching the result.
+
+    Repeated probes with the same command line (brew lookups, config
+    tools, gcc) reuse the first result instead of spawning another
+    process.
+
+    Args:
+        cmd (tuple of str):
+            The command line to run. This must be a tuple, so it can be
+            used as a cache key.
 
+    Returns:
+        str:
+        The command's output, decoded and with surrounding whitespace
+        stripped.
+
+    Raises:
+        subprocess.CalledProcessError:
+            The command exited with a non-zero status.
+    """
+    import subprocess
+
+    return (
+        subprocess.check_output(list(cmd))
+        .decode('utf-8')
+        .strip()
+    )
+
+
+def _run_parallel(calls):
+    """Run independent callables concurrently and return their results.
+
+    Each callable typically wraps a subprocess spawn, so running them on
+    a thread pool overlaps the process startup latencies.
+
+    Args:
+        calls (list of callable):
+            The callables to run.
+
+    Returns:
+        list:
+        The results, in the same order as the calls.
+    """
+    from concurrent import futures
+
+    with futures.ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        return [
+            future.result()
+            for future in [executor.submit(call) for call in calls]
+        ]
+
+
+def _query_config_tool(config_path, option):
+    """Return the output of an apr-1-config/apu-1-config style tool.
+
+    Args:
+        config_path (str):
+            The path to the config tool.
+
+        option (str):
+            The command line option to pass to it.
+
+    Returns:
+        str:
+        The tool's output, with surrounding whitespace stripped.
+    """
+    return _run_output((config_path, option))
+
+
+@functools.lru_cache(maxsize=None)
 def get_brew_prefix(package):
+    from subprocess import CalledProcessError
+
     try:
-        path = (
-            subprocess.check_output(['brew', '--prefix', package])
-            .strip()
-            .decode('utf-8')
-        )
+        path = _run_output(('brew', '--prefix', package))
         debug('%s was found in brew: %s\n' % (package, path))
 
         return path
@@ -131,6 +739,7 @@ def get_brew_prefix(package):
         return None
 
 
+@functools.lru_cache(maxsize=None)
 def get_linux_arch():
     """Return the current multiarch architecture for Linux.
 
@@ -138,12 +747,10 @@ def get_linux_arch():
         str:
         The architecture, or ``None`` if it can't be determined.
     """
+    from subprocess import CalledProcessError
+
     try:
-        return (
-            subprocess.check_output(['gcc', '-dumpmachine'])
-            .strip()
-            .decode('utf-8')
-        )
+        return _run_output(('gcc', '-dumpmachine'))
     except CalledProcessError:
         return None
 
@@ -173,7 +780,49 @@ def get_linux_arch_dirs():
     ]
 
 
+def _pip_install(src_path):
+    """Install a source tree with pip.
+
+    pip is invoked in-process when possible, skipping the startup cost
+    of a second Python interpreter. Its entry point is a private API,
+    so if it isn't where we expect, this falls back to running pip in a
+    subprocess.
+
+    Args:
+        src_path (str):
+            The path of the source tree to install.
+
+    Returns:
+        int:
+        The command's exit code. 0 means success.
+    """
+    import subprocess
+
+    try:
+        from pip._internal.cli.main import main as pip_main
+    except ImportError:
+        pip_main = None
+
+    if pip_main is not None:
+        debug('Installing with in-process pip\n')
+
+        try:
+            return pip_main(['install', src_path])
+        except SystemExit as e:
+            return e.code or 0
+
+    return subprocess.call([sys.executable, '-m', 'pip', 'install',
+                            src_path])
+
+
 def build_pysvn(src_path, install=True):
+    import getpass
+    import glob
+    import platform
+    import shutil
+    import subprocess
+    import tempfile
+
     system = platform.system()
     debug('System = %s\n' % system)
     debug('Machine = %s\n' % platform.machine())
@@ -197,17 +846,8 @@ def build_pysvn(src_path, install=True):
 
     # We need to patch setup.py to specify the --pycxx-dir parameter.
     setup_py_path = os.path.join(src_path, 'setup.py')
-
-    with open(setup_py_path, 'r') as fp:
-        setup_py = fp.read()
-
     config_token = 'setup.py configure'
 
-    if config_token not in setup_py:
-        sys.stderr.write("PySVN's setup.py can no longer be patched.\n")
-        sys.stderr.write('Please report to support@beanbaginc.com.\n')
-        sys.exit(1)
-
     config_args = ['--pycxx-dir="%s"' % pycxx_path]
 
     extra_apr_include_paths = []
@@ -234,9 +874,14 @@ def build_pysvn(src_path, install=True):
         # We want to include a few additional places to look for headers
         # and libraries. We'll start by seeing if Homebrew has some
         # information, and we'll then proceed to including the XCode versions.
-        brew_svn_path = get_brew_prefix('subversion')
-        brew_apr_path = get_brew_prefix('apr')
-        brew_apr_util_path = get_brew_prefix('apr-util')
+        #
+        # The three brew lookups each spawn a process and are independent,
+        # so run them concurrently.
+        brew_svn_path, brew_apr_path, brew_apr_util_path = _run_parallel([
+            lambda: get_brew_prefix('subversion'),
+            lambda: get_brew_prefix('apr'),
+            lambda: get_brew_prefix('apr-util'),
+        ])
 
         if brew_apr_path:
             apr_config_path = os.path.join(brew_apr_path, 'bin',
@@ -283,23 +928,18 @@ def build_pysvn(src_path, install=True):
     # Scan for any directories based on the apu-1-config/apr-1-config tools.
     # We'll prefer these paths over any others.
     if apr_config_path and os.path.exists(apr_config_path):
-        extra_apr_include_paths.insert(
-            0,
-            subprocess.check_output([apr_config_path, '--includedir'])
-            .decode('utf-8').strip())
-
-        apr_prefix = (
-            subprocess.check_output([apr_config_path, '--prefix'])
-            .decode('utf-8').strip()
-        )
+        apr_includedir, apr_prefix = _run_parallel([
+            lambda: _query_config_tool(apr_config_path, '--includedir'),
+            lambda: _query_config_tool(apr_config_path, '--prefix'),
+        ])
 
+        extra_apr_include_paths.insert(0, apr_includedir)
         extra_apr_lib_paths.append(os.path.join(apr_prefix, 'lib'))
 
     if apu_config_path and os.path.exists(apu_config_path):
         extra_apu_include_paths.insert(
             0,
-            subprocess.check_output([apu_config_path, '--includedir'])
-            .decode('utf-8').strip())
+            _query_config_tool(apu_config_path, '--includedir'))
 
     debug('Extra APR include paths: %r\n' % (extra_apr_include_paths,))
     debug('Extra APR lib paths: %r\n' % (extra_apr_lib_paths,))
@@ -309,52 +949,72 @@ def build_pysvn(src_path, install=True):
     debug('Extra SVN lib paths: %r\n' % (extra_svn_lib_paths,))
 
     for path in extra_apr_include_paths:
-        if os.path.exists(os.path.join(path, 'apr.h')):
+        if _has_file(path, 'apr.h'):
             config_args.append('--apr-inc-dir="%s"' % path)
             break
 
     if libapr_filename:
         for path in extra_apr_lib_paths:
-            if os.path.exists(os.path.join(path, libapr_filename)):
+            if _has_file(path, libapr_filename):
                 config_args.append('--apr-lib-dir="%s"' % path)
                 break
 
     for path in extra_apu_include_paths:
-        if os.path.exists(os.path.join(path, 'apu.h')):
+        if _has_file(path, 'apu.h'):
             config_args.append('--apu-inc-dir="%s"' % path)
             break
 
     for path in extra_svn_bin_paths:
-        if os.path.exists(os.path.join(path, 'svn')):
+        if _has_file(path, 'svn'):
             config_args.append('--svn-bin-dir="%s"' % path)
             break
 
     for path in extra_svn_include_paths:
-        if os.path.exists(os.path.join(path, 'svn_client.h')):
+        if _has_file(path, 'svn_client.h'):
             config_args.append('--svn-inc-dir="%s"' % path)
             break
 
     if libsvn_client_filename:
         for path in extra_svn_lib_paths:
-            if os.path.exists(os.path.join(path, libsvn_client_filename)):
+            if _has_file(path, libsvn_client_filename):
                 config_args.append('--svn-lib-dir="%s"' % path)
                 break
 
     debug('Using configuration arguments: %r\n' % (config_args,))
 
-    setup_py = setup_py.replace(config_token,
-                                '%s %s' % (config_token,
-                                           ' '.join(config_args)))
+    # Patch setup.py in a single streaming pass, writing to a temporary
+    # file alongside it and renaming into place. That keeps the rewrite
+    # atomic, so a crash can't leave a half-written setup.py behind.
+    patched_token = '%s %s' % (config_token, ' '.join(config_args))
+    token_found = False
+
+    with open(setup_py_path, 'r') as src:
+        dst = tempfile.NamedTemporaryFile(mode='w', dir=src_path,
+                                          delete=False)
+
+        with dst:
+            for line in src:
+                if config_token in line:
+                    token_found = True
+                    line = line.replace(config_token, patched_token)
+
+                dst.write(line)
+
+    if not token_found:
+        os.remove(dst.name)
+        sys.stderr.write("PySVN's setup.py can no longer be patched.\n")
+        sys.stderr.write('Please report to support@beanbaginc.com.\n')
+        sys.exit(1)
 
-    with open(setup_py_path, 'w') as fp:
-        fp.write(setup_py)
+    shutil.copymode(setup_py_path, dst.name)
+    os.replace(dst.name, setup_py_path)
 
     if install:
-        cmd_args = ['-m', 'pip', 'install', src_path]
+        result = _pip_install(src_path)
     else:
-        cmd_args = ['setup.py', 'bdist_wheel', '--dist-dir', cwd]
+        result = subprocess.call([sys.executable, 'setup.py', 'bdist_wheel',
+                                  '--dist-dir', cwd])
 
-    result = subprocess.call([sys.executable] + cmd_args)
     debug('Exit code = %s\n' % result)
 
     return result
@@ -364,6 +1024,9 @@ def main():
     global cwd
     global temp_path
 
+    import platform
+    import tempfile
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--pysvn-version',
                         default=os.environ.get('PYSVN_INSTALLER_VERSION'),
@@ -371,6 +1034,11 @@ def main():
     parser.add_argument('--file',
                         default=os.environ.get('PYSVN_INSTALLER_SRC_FILE'),
                         help='A specific PySVN source tarball to install.')
+    parser.add_argument('--refresh-version',
+                        action='store_true',
+                        default=False,
+                        help='Look up the latest PySVN version, even if a '
+                             'cached result exists.')
     parser.add_argument('--build-only',
                         action='store_true',
                         default=os.environ.get('PYSVN_INSTALLER_BUILD_ONLY',
@@ -380,9 +1048,18 @@ def main():
 
     args = parser.parse_args()
 
+    check_dependencies()
+
     cwd = os.getcwd()
 
-    temp_path = tempfile.mkdtemp(suffix='.pysvn-install')
+    # Keep the work area on the same filesystem as the current directory
+    # by default. /tmp is often a different device (tmpfs), and crossing
+    # devices turns the wheel move and cleanup of the extracted source
+    # tree into full copies. Users with RAM to spare can point
+    # $PYSVN_INSTALLER_TMPDIR at /dev/shm for a faster build instead.
+    temp_path = tempfile.mkdtemp(
+        suffix='.pysvn-install',
+        dir=os.environ.get('PYSVN_INSTALLER_TMPDIR') or cwd)
     atexit.register(destroy_temp)
 
     if args.file:
@@ -396,7 +1073,7 @@ def main():
             pysvn_version = args.pysvn_version
         else:
             print('Looking up latest PySVN version...')
-            pysvn_version = get_pysvn_version()
+            pysvn_version = get_pysvn_version(refresh=args.refresh_version)
 
             if pysvn_version == '1.9.13':
                 pysvn_version = '1.9.12'
@@ -433,10 +1110,7 @@ def main():
             sys.stderr.write('Note that you will need to install Homebrew '
                              'from https://brew.sh/\n')
         elif system == 'Linux':
-            if sys.version_info[0] == 3:
-                pkg_prefix = 'python3'
-            else:
-                pkg_prefix = 'python'
+            pkg_prefix = 'python3'
 
             sys.stderr.write('On Linux, you will need Python development '
                              'headers and\n')